@@ -1,6 +1,7 @@
 import numpy as np
-from scipy.io import wavfile
-from scipy.signal import butter, lfilter
+import soundfile as sf
+from scipy.signal import butter, sosfilt
+from functools import lru_cache
 import os
 
 SAMPLE_RATE = 44100
@@ -20,25 +21,48 @@ NOTES = {
 }
 
 
+@lru_cache(maxsize=32)
+def time_basis(num_samples, sample_rate=SAMPLE_RATE):
+    """Shared read-only time axis; notes of the same length reuse one array."""
+    t = np.arange(num_samples, dtype=np.float32) / sample_rate
+    t.setflags(write=False)
+    return t
+
+
 def sawtooth_wave(freq, duration, sample_rate=SAMPLE_RATE):
     """Generate a sawtooth waveform."""
-    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-    # Sawtooth: rises from -1 to 1 over each period
-    wave = 2.0 * (t * freq - np.floor(0.5 + t * freq))
-    return t, wave
+    # Sawtooth: rises from -1 to 1 over each period. Worked in place on the
+    # phase buffer so only one temporary is allocated.
+    wave = time_basis(int(sample_rate * duration), sample_rate) * freq
+    wave -= np.floor(wave + 0.5)
+    wave *= 2.0
+    return wave
+
+
+@lru_cache(maxsize=128)
+def butter_lowpass_sos(order, normalized_cutoff):
+    """Design a Butterworth low-pass once per (order, cutoff) and reuse it."""
+    # Second-order sections stay stable at low cutoffs (200 Hz is ~0.009 of
+    # Nyquist) where a single 4th-order (b, a) polynomial loses precision,
+    # and are stable enough to run in float32
+    sos = butter(order, normalized_cutoff, btype='low', output='sos').astype(np.float32)
+    # Left writable: sosfilt won't take a read-only array, and never modifies it
+    return sos
 
 
 def low_pass_filter(signal, cutoff, sample_rate=SAMPLE_RATE, order=4):
     """Apply a Butterworth low-pass filter."""
     nyq = sample_rate / 2.0
     normalized_cutoff = min(cutoff / nyq, 0.99)
-    b, a = butter(order, normalized_cutoff, btype='low')
-    return lfilter(b, a, signal)
+    return sosfilt(butter_lowpass_sos(order, round(normalized_cutoff, 6)), signal)
 
 
+@lru_cache(maxsize=32)
 def adsr_envelope(num_samples, attack=0.01, decay=0.05, sustain_level=0.7, release=0.1, sample_rate=SAMPLE_RATE):
-    """Generate an ADSR envelope."""
-    env = np.zeros(num_samples)
+    """Generate an ADSR envelope.
+
+    Notes of the same length and shape share one cached, read-only envelope.
+    """
     attack_samples = int(attack * sample_rate)
     decay_samples = int(decay * sample_rate)
     release_samples = int(release * sample_rate)
@@ -47,47 +71,52 @@ def adsr_envelope(num_samples, attack=0.01, decay=0.05, sustain_level=0.7, relea
     if sustain_samples < 0:
         # Short note: just do attack and release
         half = num_samples // 2
-        env[:half] = np.linspace(0, 1, half)
-        env[half:] = np.linspace(1, 0, num_samples - half)
-        return env
-
-    idx = 0
-    # Attack
-    env[idx:idx + attack_samples] = np.linspace(0, 1, attack_samples)
-    idx += attack_samples
-    # Decay
-    env[idx:idx + decay_samples] = np.linspace(1, sustain_level, decay_samples)
-    idx += decay_samples
-    # Sustain
-    env[idx:idx + sustain_samples] = sustain_level
-    idx += sustain_samples
-    # Release
-    env[idx:idx + release_samples] = np.linspace(sustain_level, 0, release_samples)
+        env = np.concatenate([
+            np.linspace(0, 1, half, endpoint=False, dtype=np.float32),
+            np.linspace(1, 0, num_samples - half, dtype=np.float32),
+        ])
+    else:
+        # Build the four segments and join them in a single allocation
+        env = np.concatenate([
+            np.linspace(0, 1, attack_samples, endpoint=False, dtype=np.float32),
+            np.linspace(1, sustain_level, decay_samples, endpoint=False, dtype=np.float32),
+            np.full(sustain_samples, sustain_level, dtype=np.float32),
+            np.linspace(sustain_level, 0, release_samples, dtype=np.float32),
+        ])
+    env.setflags(write=False)
     return env
 
 
-def make_bass_note(freq, duration, cutoff=600, volume=0.8):
-    """Create a single bass note with saw wave, filter, and envelope."""
-    t, wave = sawtooth_wave(freq, duration)
+def make_bass_note(freq, duration, cutoff=600, volume=0.8, out=None):
+    """Create a single bass note with saw wave, filter, and envelope.
+
+    Each stage works in place on the note buffer, so the only full-length
+    temporaries are the sub oscillator and the filter output. If out is
+    given (e.g. the note's slot in a section buffer), the note is written
+    there instead of into a new array.
+    """
+    wave = sawtooth_wave(freq, duration)
     # Add a sub-oscillator (sine wave one octave below) for thickness
-    wave = wave * 0.7 + 0.3 * np.sin(2 * np.pi * (freq / 2) * t)
+    wave *= 0.7
+    # float32 sin on the cached time axis is several times faster than a
+    # resonator recurrence in lfilter, and allocates no float64 buffers
+    wave += 0.3 * np.sin(np.float32(2 * np.pi * freq / 2) * time_basis(len(wave)))
     # Low-pass filter
     wave = low_pass_filter(wave, cutoff)
-    # ADSR envelope
-    env = adsr_envelope(len(wave))
-    wave = wave * env
-    # Normalize
-    wave = wave / (np.max(np.abs(wave)) + 1e-9) * volume
+    # ADSR envelope, applied on the way into the output buffer
+    wave = np.multiply(wave, adsr_envelope(len(wave)), out=out)
+    # Normalize (peak from max/min avoids an abs() copy)
+    peak = max(wave.max(), -wave.min())
+    wave *= volume / (peak + 1e-9)
     return wave
 
 
 def save_wav(filename, audio, sample_rate=SAMPLE_RATE):
     """Save audio as 16-bit WAV."""
-    # Clip and convert to int16
-    audio = np.clip(audio, -1.0, 1.0)
-    audio_int16 = (audio * 32767).astype(np.int16)
-    wavfile.write(filename, sample_rate, audio_int16)
-    print(f"Saved {filename} ({len(audio_int16)} samples, {len(audio_int16)/sample_rate:.2f}s)")
+    # Clip, then let soundfile do the 16-bit conversion while writing
+    audio = np.clip(audio, -1.0, 1.0).astype(np.float32, copy=False)
+    sf.write(filename, audio, sample_rate, subtype='PCM_16')
+    print(f"Saved {filename} ({len(audio)} samples, {len(audio)/sample_rate:.2f}s)")
 
 
 # ============================================================
@@ -97,19 +126,18 @@ def save_wav(filename, audio, sample_rate=SAMPLE_RATE):
 def generate_intro():
     duration = 16 * BEAT_DUR  # 8 seconds
     num_samples = int(SAMPLE_RATE * duration)
-    t = np.linspace(0, duration, num_samples, endpoint=False)
 
     # Pure sine sub bass at C2 - very subtle
-    wave = np.sin(2 * np.pi * NOTES['C2'] * t)
+    wave = np.sin(np.float32(2 * np.pi * NOTES['C2']) * time_basis(num_samples))
     # Very gentle filter
     wave = low_pass_filter(wave, 200)
     # Slow fade in over first 2 seconds, then sustain
-    envelope = np.ones(num_samples)
+    envelope = np.ones(num_samples, dtype=np.float32)
     fade_in_samples = int(2.0 * SAMPLE_RATE)
-    envelope[:fade_in_samples] = np.linspace(0, 1, fade_in_samples)
+    envelope[:fade_in_samples] = np.linspace(0, 1, fade_in_samples, dtype=np.float32)
     # Gentle fade out at the end
     fade_out_samples = int(1.0 * SAMPLE_RATE)
-    envelope[-fade_out_samples:] = np.linspace(1, 0.8, fade_out_samples)
+    envelope[-fade_out_samples:] = np.linspace(1, 0.8, fade_out_samples, dtype=np.float32)
 
     wave = wave * envelope * 0.25  # Very quiet
     save_wav("bass_intro.wav", wave)
@@ -126,14 +154,17 @@ def generate_verse():
     total_beats = 32
     repeats = total_beats // len(pattern)
 
-    all_notes = []
+    # Every note is the same length, so each one is rendered straight into
+    # its slot of the section buffer
+    note_len = int(SAMPLE_RATE * note_duration)
+    audio = np.empty(repeats * len(pattern) * note_len, dtype=np.float32)
+    slot = 0
     for _ in range(repeats):
         for note_name in pattern:
             freq = NOTES[note_name]
-            note = make_bass_note(freq, note_duration, cutoff=500, volume=0.8)
-            all_notes.append(note)
-
-    audio = np.concatenate(all_notes)
+            make_bass_note(freq, note_duration, cutoff=500, volume=0.8,
+                           out=audio[slot:slot + note_len])
+            slot += note_len
 
     # Add slight portamento by smoothing transitions
     # Apply overall slight compression/warmth
@@ -154,20 +185,22 @@ def generate_chorus():
     total_beats = 32
     repeats = total_beats // len(pattern)
 
-    all_notes = []
-    note_index = 0
     total_notes = total_beats
 
+    # Every note is the same length, so each one is rendered straight into
+    # its slot of the section buffer
+    note_len = int(SAMPLE_RATE * note_duration)
+    audio = np.empty(total_notes * note_len, dtype=np.float32)
+
     for rep in range(repeats):
         for i, note_name in enumerate(pattern):
             freq = NOTES[note_name]
             # Filter sweep: cutoff increases through each repetition
-            progress = (rep * len(pattern) + i) / total_notes
+            note_index = rep * len(pattern) + i
+            progress = note_index / total_notes
             cutoff = 400 + progress * 500  # 400Hz to 900Hz sweep
-            note = make_bass_note(freq, note_duration, cutoff=cutoff, volume=0.85)
-            all_notes.append(note)
-
-    audio = np.concatenate(all_notes)
+            make_bass_note(freq, note_duration, cutoff=cutoff, volume=0.85,
+                           out=audio[note_index * note_len:(note_index + 1) * note_len])
     audio = audio / (np.max(np.abs(audio)) + 1e-9) * 0.85
 
     save_wav("bass_chorus.wav", audio)
@@ -180,17 +213,17 @@ def generate_chorus():
 def generate_outro():
     duration = 16 * BEAT_DUR  # 8 seconds
     num_samples = int(SAMPLE_RATE * duration)
-    t = np.linspace(0, duration, num_samples, endpoint=False)
 
     # Saw wave at C2
-    wave = 2.0 * (t * NOTES['C2'] - np.floor(0.5 + t * NOTES['C2']))
+    wave = sawtooth_wave(NOTES['C2'], duration)
     # Add sub sine
-    wave = wave * 0.6 + 0.4 * np.sin(2 * np.pi * NOTES['C2'] * t)
+    wave *= 0.6
+    wave += 0.4 * np.sin(np.float32(2 * np.pi * NOTES['C2']) * time_basis(num_samples))
     # Filter
     wave = low_pass_filter(wave, 500)
 
     # Long fade out over entire duration
-    fade_envelope = np.linspace(0.8, 0.0, num_samples)
+    fade_envelope = np.linspace(0.8, 0.0, num_samples, dtype=np.float32)
     wave = wave * fade_envelope
     wave = wave / (np.max(np.abs(wave)) + 1e-9) * 0.7
 
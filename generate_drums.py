@@ -1,18 +1,45 @@
 import numpy as np
-from scipy.io import wavfile
+import soundfile as sf
 import os
 
 SAMPLE_RATE = 44100
 BPM = 120
 BEAT_DURATION = 60.0 / BPM  # 0.5 seconds per beat
 
-def generate_kick(duration=0.15, sample_rate=SAMPLE_RATE):
-    """Low frequency sine sweep 150Hz->50Hz with fast decay."""
-    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-    # Frequency sweep from 150 to 50 Hz
-    freq = 150 * np.exp(-t * np.log(150/50) / duration)
-    # Phase is integral of frequency
-    phase = 2 * np.pi * np.cumsum(freq) / sample_rate
+# Grid positions in whole samples, so hit positions are plain integer tables
+BEAT_SAMPLES = int(BEAT_DURATION * SAMPLE_RATE)
+BAR_SAMPLES = 4 * BEAT_SAMPLES
+EIGHTH_SAMPLES = BEAT_SAMPLES // 2
+SIXTEENTH_SAMPLES = BEAT_SAMPLES // 4
+
+# One PCG64 stream for all drum noise, seeded so renders are repeatable
+RNG = np.random.default_rng(0xC0FFEE)
+
+# Deterministic parts of each one-shot (sweeps, tones, envelopes), keyed by
+# (name, duration, sample_rate). Built on first use and shared read-only by
+# every hit, so a track only pays for them once.
+_ONESHOT_CACHE = {}
+
+def _cached(key, build, *args):
+    """Return the cached one-shot part for key, building it on first use."""
+    part = _ONESHOT_CACHE.get(key)
+    if part is None:
+        part = build(*args)
+        for arr in part if isinstance(part, tuple) else (part,):
+            arr.setflags(write=False)
+        _ONESHOT_CACHE[key] = part
+    return part
+
+def _decay_envelope(duration, rate, sample_rate):
+    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False, dtype=np.float32)
+    return np.exp(-t * rate)
+
+def _build_kick(duration, sample_rate):
+    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False, dtype=np.float32)
+    # Frequency sweep from 150 to 50 Hz: freq = 150 * exp(-k * t / duration).
+    # Phase is its integral, which has a closed form
+    k = np.float32(np.log(150/50))
+    phase = (2 * np.pi * 150 * duration / k) * (1.0 - np.exp(-k * t / duration))
     # Amplitude envelope - fast exponential decay
     envelope = np.exp(-t * 30)
     kick = np.sin(phase) * envelope
@@ -23,147 +50,148 @@ def generate_kick(duration=0.15, sample_rate=SAMPLE_RATE):
     kick = kick * 0.85 + click * 0.15
     return kick
 
-def generate_snare(duration=0.12, sample_rate=SAMPLE_RATE):
-    """White noise burst with tonal component, fast decay."""
-    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-    # Noise component
-    noise = np.random.randn(len(t))
-    noise_env = np.exp(-t * 40)
+def _build_snare(duration, sample_rate):
+    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False, dtype=np.float32)
+    noise_env = np.exp(-t * 40) * 0.6
     # Tonal component (around 200Hz)
-    tone = np.sin(2 * np.pi * 200 * t) * np.exp(-t * 50)
-    snare = noise * noise_env * 0.6 + tone * 0.4
-    return snare
+    tone = np.sin(2 * np.pi * 200 * t) * np.exp(-t * 50) * 0.4
+    return noise_env, tone
+
+def generate_kick(duration=0.15, sample_rate=SAMPLE_RATE):
+    """Low frequency sine sweep 150Hz->50Hz with fast decay. Every hit is identical, so it is cached."""
+    return _cached(('kick', duration, sample_rate), _build_kick, duration, sample_rate)
+
+def _noise_shape(num_samples, hits):
+    return num_samples if hits is None else (hits, num_samples)
+
+def _hp_noise(num_samples, hits):
+    """High-passed white noise: Gaussian noise minus its neighbour, drawn in one block."""
+    u = RNG.standard_normal(_noise_shape(num_samples + 1, hits), dtype=np.float32)
+    return u[..., 1:] - u[..., :-1]
+
+def generate_snare(duration=0.12, sample_rate=SAMPLE_RATE, hits=None):
+    """White noise burst with tonal component, fast decay.
 
-def generate_hihat_closed(duration=0.04, sample_rate=SAMPLE_RATE):
+    With hits, returns a (hits, samples) array with a fresh noise take per hit.
+    """
+    noise_env, tone = _cached(('snare', duration, sample_rate), _build_snare, duration, sample_rate)
+    # Fresh noise per hit; only the envelope and tone are reused
+    noise = RNG.standard_normal(_noise_shape(len(tone), hits), dtype=np.float32)
+    return noise * noise_env + tone
+
+def generate_hihat_closed(duration=0.04, sample_rate=SAMPLE_RATE, hits=None):
     """High-frequency filtered noise, very short decay."""
-    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-    noise = np.random.randn(len(t))
-    # High-pass effect: differentiate the noise
-    hp_noise = np.diff(noise, prepend=0)
-    envelope = np.exp(-t * 100)
-    hihat = hp_noise * envelope
-    return hihat
-
-def generate_hihat_open(duration=0.12, sample_rate=SAMPLE_RATE):
+    envelope = _cached(('hihat_closed', duration, sample_rate), _decay_envelope, duration, 100, sample_rate)
+    return _hp_noise(len(envelope), hits) * envelope
+
+def generate_hihat_open(duration=0.12, sample_rate=SAMPLE_RATE, hits=None):
     """High-frequency filtered noise, longer decay."""
-    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-    noise = np.random.randn(len(t))
-    hp_noise = np.diff(noise, prepend=0)
-    envelope = np.exp(-t * 20)
-    hihat = hp_noise * envelope
-    return hihat
-
-def place_sound(track, sound, position_samples, volume=1.0):
-    """Place a sound into the track at a given sample position."""
-    start = int(position_samples)
-    end = start + len(sound)
-    if end > len(track):
-        end = len(track)
-        sound = sound[:end - start]
-    track[start:end] += sound * volume
-
-def beat_to_samples(beat):
-    """Convert beat number to sample position."""
-    return int(beat * BEAT_DURATION * SAMPLE_RATE)
+    envelope = _cached(('hihat_open', duration, sample_rate), _decay_envelope, duration, 20, sample_rate)
+    return _hp_noise(len(envelope), hits) * envelope
+
+def place_hits(track, sound, positions, volumes):
+    """Mix a sound into the track at every sample position with one vectorized add.
+
+    sound is either a single one-shot shared by all hits or a (hits, samples)
+    array with one take per hit, and volumes is a scalar or one per hit.
+    Anything past the end of the track is cut off.
+    """
+    if len(positions) == 0:
+        return
+    index = positions[:, None] + np.arange(sound.shape[-1])
+    volumes = np.broadcast_to(np.asarray(volumes, dtype=np.float32), positions.shape)
+    scaled = sound * volumes[:, None]
+    inside = index < len(track)
+    np.add.at(track, index[inside], scaled[inside])
 
 def normalize_and_convert(track):
-    """Normalize to 16-bit range."""
+    """Normalize to 0.9 peak as float32, ready to be written as 16-bit PCM."""
     if np.max(np.abs(track)) > 0:
         track = track / np.max(np.abs(track)) * 0.9
-    return (track * 32767).astype(np.int16)
+    return track.astype(np.float32, copy=False)
 
 def generate_intro(num_beats=16):
     """Light hi-hats only, building atmosphere. 16 beats = 8 seconds."""
-    total_samples = int(num_beats * BEAT_DURATION * SAMPLE_RATE)
-    track = np.zeros(total_samples)
+    track = np.zeros(num_beats * BEAT_SAMPLES, dtype=np.float32)
 
     # Hi-hats on eighth notes (every 0.5 beat), gradually getting louder
     total_eighth_notes = num_beats * 2
-    for i in range(total_eighth_notes):
-        beat_pos = i * 0.5
-        # Volume builds from 0.15 to 0.6 over the intro
-        vol = 0.15 + 0.45 * (i / total_eighth_notes)
-        # Alternate between closed hi-hats, occasional open on beat
-        if i % 4 == 0 and i > total_eighth_notes // 2:
-            place_sound(track, generate_hihat_open(), beat_to_samples(beat_pos), vol)
-        else:
-            place_sound(track, generate_hihat_closed(), beat_to_samples(beat_pos), vol)
-
+    eighths = np.arange(total_eighth_notes)
+    positions = EIGHTH_SAMPLES * eighths
+    # Volume builds from 0.15 to 0.6 over the intro
+    volumes = 0.15 + 0.45 * (eighths / total_eighth_notes)
+    # Alternate between closed hi-hats, occasional open on beat
+    is_open = (eighths % 4 == 0) & (eighths > total_eighth_notes // 2)
+    is_closed = ~is_open
+
+    place_hits(track, generate_hihat_open(hits=is_open.sum()), positions[is_open], volumes[is_open])
+    place_hits(track, generate_hihat_closed(hits=is_closed.sum()), positions[is_closed], volumes[is_closed])
     return normalize_and_convert(track)
 
 def generate_verse(num_beats=32):
     """Classic electronic beat: kick on 1&3, snare on 2&4, hi-hats on 8ths. 32 beats = 16 sec."""
-    total_samples = int(num_beats * BEAT_DURATION * SAMPLE_RATE)
-    track = np.zeros(total_samples)
-
-    for bar in range(num_beats // 4):
-        bar_offset = bar * 4
-        # Kick on beats 1 and 3
-        place_sound(track, generate_kick(), beat_to_samples(bar_offset + 0), 0.9)
-        place_sound(track, generate_kick(), beat_to_samples(bar_offset + 2), 0.85)
-        # Snare on beats 2 and 4
-        place_sound(track, generate_snare(), beat_to_samples(bar_offset + 1), 0.75)
-        place_sound(track, generate_snare(), beat_to_samples(bar_offset + 3), 0.75)
-        # Hi-hats on eighth notes
-        for eighth in range(8):
-            beat_pos = bar_offset + eighth * 0.5
-            place_sound(track, generate_hihat_closed(), beat_to_samples(beat_pos), 0.45)
-
+    track = np.zeros(num_beats * BEAT_SAMPLES, dtype=np.float32)
+    bar_starts = BAR_SAMPLES * np.arange(num_beats // 4)
+
+    # Kick on beats 1 and 3
+    kicks = np.add.outer(bar_starts, [0, 2 * BEAT_SAMPLES]).ravel()
+    place_hits(track, generate_kick(), kicks, np.tile([0.9, 0.85], len(bar_starts)))
+    # Snare on beats 2 and 4
+    snares = np.add.outer(bar_starts, [BEAT_SAMPLES, 3 * BEAT_SAMPLES]).ravel()
+    place_hits(track, generate_snare(hits=len(snares)), snares, 0.75)
+    # Hi-hats on eighth notes
+    hats = EIGHTH_SAMPLES * np.arange(num_beats * 2)
+    place_hits(track, generate_hihat_closed(hits=len(hats)), hats, 0.45)
     return normalize_and_convert(track)
 
 def generate_chorus(num_beats=32):
     """Energetic driving pattern with fills, kick on every beat, open hats. 32 beats = 16 sec."""
-    total_samples = int(num_beats * BEAT_DURATION * SAMPLE_RATE)
-    track = np.zeros(total_samples)
-
-    for bar in range(num_beats // 4):
-        bar_offset = bar * 4
-        # Kick on every beat (four-on-the-floor)
-        for beat in range(4):
-            place_sound(track, generate_kick(), beat_to_samples(bar_offset + beat), 0.95)
-        # Snare on 2 and 4
-        place_sound(track, generate_snare(), beat_to_samples(bar_offset + 1), 0.85)
-        place_sound(track, generate_snare(), beat_to_samples(bar_offset + 3), 0.85)
-        # Open hi-hats on off-beats, closed on beats
-        for eighth in range(8):
-            beat_pos = bar_offset + eighth * 0.5
-            if eighth % 2 == 1:  # Off-beats get open hats
-                place_sound(track, generate_hihat_open(), beat_to_samples(beat_pos), 0.55)
-            else:
-                place_sound(track, generate_hihat_closed(), beat_to_samples(beat_pos), 0.5)
-
-        # Add a fill on every 4th bar (snare rolls on last beat)
-        if (bar + 1) % 4 == 0:
-            for sixteenth in range(4):
-                fill_pos = bar_offset + 3 + sixteenth * 0.25
-                place_sound(track, generate_snare(), beat_to_samples(fill_pos), 0.7 + sixteenth * 0.05)
-
+    track = np.zeros(num_beats * BEAT_SAMPLES, dtype=np.float32)
+    bars = np.arange(num_beats // 4)
+    bar_starts = BAR_SAMPLES * bars
+
+    # Kick on every beat (four-on-the-floor)
+    kicks = BEAT_SAMPLES * np.arange(num_beats)
+    place_hits(track, generate_kick(), kicks, 0.95)
+
+    # Snare on 2 and 4
+    snares = np.add.outer(bar_starts, [BEAT_SAMPLES, 3 * BEAT_SAMPLES]).ravel()
+    snare_volumes = np.full(len(snares), 0.85)
+    # Add a fill on every 4th bar (snare rolls on last beat)
+    fill_starts = bar_starts[(bars + 1) % 4 == 0] + 3 * BEAT_SAMPLES
+    fills = np.add.outer(fill_starts, SIXTEENTH_SAMPLES * np.arange(4)).ravel()
+    fill_volumes = np.tile(0.7 + 0.05 * np.arange(4), len(fill_starts))
+    snares = np.concatenate([snares, fills])
+    place_hits(track, generate_snare(hits=len(snares)), snares, np.concatenate([snare_volumes, fill_volumes]))
+
+    # Open hi-hats on off-beats, closed on beats
+    eighths = EIGHTH_SAMPLES * np.arange(num_beats * 2)
+    open_hats, closed_hats = eighths[1::2], eighths[::2]
+    place_hits(track, generate_hihat_open(hits=len(open_hats)), open_hats, 0.55)
+    place_hits(track, generate_hihat_closed(hits=len(closed_hats)), closed_hats, 0.5)
     return normalize_and_convert(track)
 
 def generate_outro(num_beats=16):
     """Gradually fading pattern. 16 beats = 8 seconds."""
-    total_samples = int(num_beats * BEAT_DURATION * SAMPLE_RATE)
-    track = np.zeros(total_samples)
-
-    for bar in range(num_beats // 4):
-        bar_offset = bar * 4
-        # Fade factor: goes from 1.0 to ~0.1
-        fade = 1.0 - (bar / (num_beats // 4)) * 0.85
-
-        # Kick on 1 and 3 (fading)
-        place_sound(track, generate_kick(), beat_to_samples(bar_offset + 0), 0.9 * fade)
-        if bar < 3:  # Drop kick on 3 in last bar
-            place_sound(track, generate_kick(), beat_to_samples(bar_offset + 2), 0.8 * fade)
-        # Snare on 2 and 4 (fading, drop snare on 4 in last 2 bars)
-        place_sound(track, generate_snare(), beat_to_samples(bar_offset + 1), 0.7 * fade)
-        if bar < 2:
-            place_sound(track, generate_snare(), beat_to_samples(bar_offset + 3), 0.7 * fade)
-        # Hi-hats on eighth notes (fading)
-        for eighth in range(8):
-            beat_pos = bar_offset + eighth * 0.5
-            hh_fade = fade * (1.0 - (eighth / 8) * 0.3)
-            place_sound(track, generate_hihat_closed(), beat_to_samples(beat_pos), 0.4 * hh_fade)
-
+    track = np.zeros(num_beats * BEAT_SAMPLES, dtype=np.float32)
+    bars = np.arange(num_beats // 4)
+    bar_starts = BAR_SAMPLES * bars
+    # Fade factor: goes from 1.0 to ~0.1
+    fade = 1.0 - (bars / (num_beats // 4)) * 0.85
+
+    # Kick on 1 and 3 (fading), dropping the kick on 3 in the last bar
+    keep = bars < 3
+    kicks = np.concatenate([bar_starts, bar_starts[keep] + 2 * BEAT_SAMPLES])
+    place_hits(track, generate_kick(), kicks, np.concatenate([0.9 * fade, 0.8 * fade[keep]]))
+    # Snare on 2 and 4 (fading, drop snare on 4 in last 2 bars)
+    keep = bars < 2
+    snares = np.concatenate([bar_starts + BEAT_SAMPLES, bar_starts[keep] + 3 * BEAT_SAMPLES])
+    place_hits(track, generate_snare(hits=len(snares)), snares, np.concatenate([0.7 * fade, 0.7 * fade[keep]]))
+    # Hi-hats on eighth notes (fading)
+    eighth = np.arange(8)
+    hats = np.add.outer(bar_starts, EIGHTH_SAMPLES * eighth).ravel()
+    hh_fade = np.outer(fade, 1.0 - (eighth / 8) * 0.3).ravel()
+    place_hits(track, generate_hihat_closed(hits=len(hats)), hats, 0.4 * hh_fade)
     return normalize_and_convert(track)
 
 if __name__ == "__main__":
@@ -171,22 +199,22 @@ if __name__ == "__main__":
 
     print("Generating intro drums...")
     intro = generate_intro()
-    wavfile.write(os.path.join(output_dir, "drums_intro.wav"), SAMPLE_RATE, intro)
+    sf.write(os.path.join(output_dir, "drums_intro.wav"), intro, SAMPLE_RATE, subtype='PCM_16')
     print(f"  -> drums_intro.wav ({len(intro)} samples, {len(intro)/SAMPLE_RATE:.1f}s)")
 
     print("Generating verse drums...")
     verse = generate_verse()
-    wavfile.write(os.path.join(output_dir, "drums_verse.wav"), SAMPLE_RATE, verse)
+    sf.write(os.path.join(output_dir, "drums_verse.wav"), verse, SAMPLE_RATE, subtype='PCM_16')
     print(f"  -> drums_verse.wav ({len(verse)} samples, {len(verse)/SAMPLE_RATE:.1f}s)")
 
     print("Generating chorus drums...")
     chorus = generate_chorus()
-    wavfile.write(os.path.join(output_dir, "drums_chorus.wav"), SAMPLE_RATE, chorus)
+    sf.write(os.path.join(output_dir, "drums_chorus.wav"), chorus, SAMPLE_RATE, subtype='PCM_16')
     print(f"  -> drums_chorus.wav ({len(chorus)} samples, {len(chorus)/SAMPLE_RATE:.1f}s)")
 
     print("Generating outro drums...")
     outro = generate_outro()
-    wavfile.write(os.path.join(output_dir, "drums_outro.wav"), SAMPLE_RATE, outro)
+    sf.write(os.path.join(output_dir, "drums_outro.wav"), outro, SAMPLE_RATE, subtype='PCM_16')
     print(f"  -> drums_outro.wav ({len(outro)} samples, {len(outro)/SAMPLE_RATE:.1f}s)")
 
     print("\nAll drum tracks generated successfully!")
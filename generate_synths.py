@@ -1,6 +1,7 @@
 import numpy as np
-from scipy.io import wavfile
-from scipy.signal import butter, lfilter
+import soundfile as sf
+from scipy.signal import butter, sosfilt, sosfilt_zi
+from functools import lru_cache
 import os
 
 SAMPLE_RATE = 44100
@@ -23,63 +24,115 @@ Eb3 = 155.56
 Bb3 = 233.08
 
 
+@lru_cache(maxsize=32)
+def time_basis(n, sr=SAMPLE_RATE):
+    """Shared read-only time axis; notes and chords of the same length reuse one array."""
+    t = np.arange(n, dtype=np.float32) / sr
+    t.setflags(write=False)
+    return t
+
+
+@lru_cache(maxsize=128)
+def butter_lowpass_sos(order, norm_cutoff):
+    """Design a Butterworth low-pass once per (order, cutoff) and reuse it."""
+    # Second-order sections are numerically stable, so they can run in float32
+    sos = butter(order, norm_cutoff, btype='low', output='sos').astype(np.float32)
+    # Left writable: sosfilt won't take a read-only array, and never modifies it
+    return sos
+
+
 def lowpass_filter(signal, cutoff, sr=SAMPLE_RATE, order=4):
     nyq = 0.5 * sr
     norm_cutoff = min(cutoff / nyq, 0.99)
-    b, a = butter(order, norm_cutoff, btype='low')
-    return lfilter(b, a, signal)
+    return sosfilt(butter_lowpass_sos(order, round(norm_cutoff, 6)), signal)
+
+
+def swept_lowpass_filter(signal, cutoffs, sr=SAMPLE_RATE, block_size=1024):
+    """4th-order low-pass whose cutoff follows cutoffs (Hz, one per sample).
+
+    Built from two cascaded RBJ biquads with Butterworth Q values. The
+    coefficients are redesigned every block_size samples and the filter
+    state carries across blocks, so the sweep is smooth in a single pass.
+    """
+    n = len(signal)
+    starts = np.arange(0, n, block_size)
+    w0 = 2 * np.pi * np.minimum(cutoffs[starts], 0.49 * sr) / sr
+    cos_w0 = np.cos(w0)[:, None]
+    sin_w0 = np.sin(w0)[:, None]
+    # Section Qs of a 4th-order Butterworth are 1 / (2 cos(pi/8)) and 1 / (2 cos(3pi/8))
+    q = 1 / (2 * np.cos(np.pi * np.array([1, 3]) / 8))
+    alpha = sin_w0 / (2 * q)
+    a0 = 1 + alpha
+    b1 = (1 - cos_w0) / a0
+    # One (sections, 6) SOS matrix per block, in scipy's [b0 b1 b2 a0 a1 a2] layout
+    sos = np.stack([b1 / 2, b1, b1 / 2, np.ones_like(a0), -2 * cos_w0 / a0, (1 - alpha) / a0], axis=-1)
+
+    filtered = np.empty(n, dtype=np.float32)
+    # Start at the steady state for the first sample, so a signal that does
+    # not begin at silence has no start-up transient either
+    zi = sosfilt_zi(sos[0]) * signal[0]
+    for k, start in enumerate(starts):
+        end = start + block_size
+        filtered[start:end], zi = sosfilt(sos[k], signal[start:end], zi=zi)
+    return filtered
 
 
+@lru_cache(maxsize=32)
 def adsr_envelope(num_samples, attack=0.01, decay=0.1, sustain_level=0.7, release=0.1, sr=SAMPLE_RATE):
-    """Generate ADSR envelope."""
-    env = np.zeros(num_samples)
-    a_samples = int(attack * sr)
-    d_samples = int(decay * sr)
-    r_samples = int(release * sr)
-    s_samples = max(0, num_samples - a_samples - d_samples - r_samples)
-
-    idx = 0
-    # Attack
-    if a_samples > 0:
-        end = min(idx + a_samples, num_samples)
-        env[idx:end] = np.linspace(0, 1, end - idx)
-        idx = end
-    # Decay
-    if idx < num_samples and d_samples > 0:
-        end = min(idx + d_samples, num_samples)
-        env[idx:end] = np.linspace(1, sustain_level, end - idx)
-        idx = end
-    # Sustain
-    if idx < num_samples and s_samples > 0:
-        end = min(idx + s_samples, num_samples)
-        env[idx:end] = sustain_level
-        idx = end
-    # Release
-    if idx < num_samples:
-        env[idx:] = np.linspace(sustain_level, 0, num_samples - idx)
-
+    """Generate ADSR envelope.
+
+    Notes of the same length and shape share one cached, read-only envelope.
+    """
+    # Clamp segments so short notes still get exactly num_samples, with the
+    # release taking whatever is left
+    a_samples = min(int(attack * sr), num_samples)
+    d_samples = min(int(decay * sr), num_samples - a_samples)
+    s_samples = max(0, num_samples - a_samples - d_samples - int(release * sr))
+    r_samples = num_samples - a_samples - d_samples - s_samples
+
+    env = np.concatenate([
+        np.linspace(0, 1, a_samples, endpoint=False, dtype=np.float32),
+        np.linspace(1, sustain_level, d_samples, endpoint=False, dtype=np.float32),
+        np.full(s_samples, sustain_level, dtype=np.float32),
+        np.linspace(sustain_level, 0, r_samples, dtype=np.float32),
+    ])
+    env.setflags(write=False)
     return env
 
 
 def saw_wave(freq, duration, sr=SAMPLE_RATE):
-    t = np.arange(int(duration * sr)) / sr
-    return 2.0 * (t * freq % 1.0) - 1.0
+    # Phase in cycles, wrapped and scaled to [-1, 1) in place
+    wave = time_basis(int(duration * sr), sr) * freq
+    np.mod(wave, 1.0, out=wave)
+    wave *= 2.0
+    wave -= 1.0
+    return wave
+
+
+def square_from_phase(phase):
+    """Square wave from a phase in cycles: +1 for the first half of each cycle, -1 for the second."""
+    return np.where(phase % 1.0 < 0.5, np.float32(1.0), np.float32(-1.0))
 
 
 def square_wave(freq, duration, sr=SAMPLE_RATE):
-    t = np.arange(int(duration * sr)) / sr
-    return np.sign(np.sin(2 * np.pi * freq * t))
+    return square_from_phase(time_basis(int(duration * sr), sr) * freq)
 
 
 def detuned_saw_pad(freqs, duration, detune_hz=3.0, sr=SAMPLE_RATE):
-    """Multiple detuned saw oscillators for pad sound."""
+    """Multiple detuned saw oscillators for pad sound.
+
+    All voices are rendered together as one (voices, samples) broadcast and
+    summed, instead of one saw_wave call per voice.
+    """
     n = int(duration * sr)
-    signal = np.zeros(n)
-    for f in freqs:
-        for offset in [-detune_hz, 0, detune_hz]:
-            signal += saw_wave(f + offset, duration, sr)
-    # Normalize by number of oscillators
-    signal /= (len(freqs) * 3)
+    voice_freqs = np.add.outer(freqs, [-detune_hz, 0, detune_hz]).reshape(-1, 1).astype(np.float32)
+    phases = voice_freqs * time_basis(n, sr)
+    np.mod(phases, 1.0, out=phases)
+    # Each saw is 2 * phase - 1; sum them, then normalize by number of oscillators
+    num_voices = len(voice_freqs)
+    signal = phases.sum(axis=0)
+    signal *= 2.0 / num_voices
+    signal -= 1.0
     return signal
 
 
@@ -88,10 +141,9 @@ def save_wav(filename, audio, sr=SAMPLE_RATE):
     peak = np.max(np.abs(audio))
     if peak > 0:
         audio = audio * (0.7 / peak)
-    # Convert to 16-bit
-    audio_16 = np.int16(audio * 32767)
-    wavfile.write(filename, sr, audio_16)
-    print(f"Saved {filename} ({len(audio_16)} samples, {len(audio_16)/sr:.2f}s)")
+    # soundfile converts to 16-bit while writing
+    sf.write(filename, audio.astype(np.float32, copy=False), sr, subtype='PCM_16')
+    print(f"Saved {filename} ({len(audio)} samples, {len(audio)/sr:.2f}s)")
 
 
 # ============================================================
@@ -100,7 +152,7 @@ def save_wav(filename, audio, sr=SAMPLE_RATE):
 def generate_intro():
     duration = 16 * BEAT_DUR  # 8 seconds
     n = int(duration * SAMPLE_RATE)
-    t = np.arange(n) / SAMPLE_RATE
+    t = time_basis(n)
 
     # Cm chord pad: C4 + Eb4 + G4 with 3 detuned oscillators each
     pad = detuned_saw_pad([C4, Eb4, G4], duration, detune_hz=3.0)
@@ -112,19 +164,7 @@ def generate_intro():
     # Slow LFO on filter cutoff for movement (0.2 Hz)
     lfo = 0.5 + 0.5 * np.sin(2 * np.pi * 0.2 * t)
     # Filter cutoff sweeps between 800 and 2500 Hz
-    # Apply filter in chunks to simulate moving cutoff
-    chunk_size = SAMPLE_RATE // 10  # 100ms chunks
-    filtered = np.zeros(n)
-    for i in range(0, n, chunk_size):
-        end = min(i + chunk_size, n)
-        chunk = pad[i:end]
-        mid = (i + end) // 2
-        if mid < n:
-            cutoff = 800 + 1700 * lfo[min(mid, n - 1)]
-        else:
-            cutoff = 800
-        filtered[i:end] = lowpass_filter(np.concatenate([pad[max(0, i - 1000):i], chunk]),
-                                          cutoff)[-(end - i):]
+    filtered = swept_lowpass_filter(pad, 800 + 1700 * lfo)
 
     save_wav("synth_intro.wav", filtered)
     return filtered
@@ -142,7 +182,7 @@ def generate_verse():
     eighth_dur = BEAT_DUR / 2  # 0.25 seconds
     num_eighths = int(duration / eighth_dur)
 
-    signal = np.zeros(n)
+    signal = np.zeros(n, dtype=np.float32)
     for i in range(num_eighths):
         note_freq = arp_notes[i % len(arp_notes)]
         start = int(i * eighth_dur * SAMPLE_RATE)
@@ -168,7 +208,6 @@ def generate_verse():
 # ============================================================
 def generate_chorus():
     duration = 32 * BEAT_DUR  # 16 seconds
-    n = int(duration * SAMPLE_RATE)
 
     # Chord progression: Cm - Ab - Eb - Bb, 2 beats each, repeating
     chords = [
@@ -177,57 +216,42 @@ def generate_chorus():
         [Eb3, G4, Bb4],         # Eb (using Eb3 root with G4 and Bb4)
         [Bb3, D4, F4],          # Bb
     ]
-    chord_dur = 2 * BEAT_DUR  # 1 second per chord
-    num_chords = int(duration / chord_dur)
-
-    stabs = np.zeros(n)
-    for i in range(num_chords):
-        chord = chords[i % len(chords)]
-        start = int(i * chord_dur * SAMPLE_RATE)
-        end = min(int((i + 1) * chord_dur * SAMPLE_RATE), n)
-        chord_len = end - start
-
-        # Saw waves for chord stab
-        chord_signal = np.zeros(chord_len)
-        for freq in chord:
-            chord_signal += saw_wave(freq, chord_len / SAMPLE_RATE)
-        chord_signal /= len(chord)
-
-        # Medium attack envelope for stabs
-        env = adsr_envelope(chord_len, attack=0.05, decay=0.15, sustain_level=0.7, release=0.1)
-        chord_signal *= env
-
-        stabs[start:end] += chord_signal[:end - start]
-
-    stabs = lowpass_filter(stabs, 2500)
-
     # Lead melody: Bb4-C5-Eb5-G4 motif, each note = 2 beats, repeating
     lead_notes = [Bb4, C5, Eb5, G4]
-    lead_dur = 2 * BEAT_DUR  # 1 second per note
-    num_lead = int(duration / lead_dur)
-
-    lead = np.zeros(n)
-    for i in range(num_lead):
-        note_freq = lead_notes[i % len(lead_notes)]
-        start = int(i * lead_dur * SAMPLE_RATE)
-        end = min(int((i + 1) * lead_dur * SAMPLE_RATE), n)
-        note_len = end - start
-
-        t_note = np.arange(note_len) / SAMPLE_RATE
-        # Square wave with vibrato (5Hz LFO, ±10 cents)
-        vibrato = note_freq * (2 ** (0.1 / 12 * np.sin(2 * np.pi * 5 * t_note)))
-        phase = np.cumsum(vibrato / SAMPLE_RATE)
-        note_signal = np.sign(np.sin(2 * np.pi * phase))
-
-        env = adsr_envelope(note_len, attack=0.02, decay=0.1, sustain_level=0.6, release=0.15)
-        note_signal *= env
-
-        lead[start:end] += note_signal[:end - start]
-
-    lead = lowpass_filter(lead, 4000)
 
-    # Mix: stabs at 0.6, lead at 0.4
-    combined = stabs * 0.6 + lead * 0.4
+    # Chords and lead notes are all 2 beats long and tile the section exactly,
+    # so each part is rendered as one (notes, samples) block and flattened
+    note_dur = 2 * BEAT_DUR  # 1 second per chord / lead note
+    num_notes = int(duration / note_dur)
+    note_len = int(note_dur * SAMPLE_RATE)
+    t = time_basis(note_len)
+
+    # Saw waves for chord stabs: (notes, voices, samples) phases summed over voices
+    chord_freqs = np.array([chords[i % len(chords)] for i in range(num_notes)], dtype=np.float32)
+    phases = chord_freqs[:, :, None] * t
+    np.mod(phases, 1.0, out=phases)
+    stabs = phases.sum(axis=1)
+    stabs *= 2.0 / chord_freqs.shape[1]
+    stabs -= 1.0
+    # Medium attack envelope for stabs
+    stabs *= adsr_envelope(note_len, attack=0.05, decay=0.15, sustain_level=0.7, release=0.1)
+    stabs = lowpass_filter(stabs.ravel(), 2500)
+
+    # Square wave with vibrato (5Hz LFO, ±10 cents). The vibrato curve is the
+    # same for every note, so its phase is integrated once and scaled by pitch.
+    # Accumulated in float64: a float32 running sum would drift in pitch
+    vibrato = 2 ** (0.1 / 12 * np.sin(2 * np.pi * 5 * t))
+    unit_phase = np.cumsum(vibrato / SAMPLE_RATE, dtype=np.float64)
+    lead_freqs = np.array([lead_notes[i % len(lead_notes)] for i in range(num_notes)])
+    lead = square_from_phase(lead_freqs[:, None] * unit_phase)
+    lead *= adsr_envelope(note_len, attack=0.02, decay=0.1, sustain_level=0.6, release=0.15)
+    lead = lowpass_filter(lead.ravel(), 4000)
+
+    # Mix: stabs at 0.6, lead at 0.4, in the stab buffer
+    combined = stabs
+    combined *= 0.6
+    lead *= 0.4
+    combined += lead
 
     save_wav("synth_chorus.wav", combined)
     return combined
@@ -239,7 +263,7 @@ def generate_chorus():
 def generate_outro():
     duration = 16 * BEAT_DUR  # 8 seconds
     n = int(duration * SAMPLE_RATE)
-    t = np.arange(n) / SAMPLE_RATE
+    t = time_basis(n)
 
     # Same Cm pad as intro
     pad = detuned_saw_pad([C4, Eb4, G4], duration, detune_hz=3.0)
@@ -247,20 +271,12 @@ def generate_outro():
     # Envelope: moderate attack, long fade to silence
     env = adsr_envelope(n, attack=0.5, decay=0.5, sustain_level=0.7, release=5.0)
     # Additional linear fade-out over entire duration
-    fade = np.linspace(1.0, 0.0, n)
+    fade = np.linspace(1.0, 0.0, n, dtype=np.float32)
     pad *= env * fade
 
     # LFO filter sweep
     lfo = 0.5 + 0.5 * np.sin(2 * np.pi * 0.15 * t)
-    chunk_size = SAMPLE_RATE // 10
-    filtered = np.zeros(n)
-    for i in range(0, n, chunk_size):
-        end = min(i + chunk_size, n)
-        chunk = pad[i:end]
-        mid = (i + end) // 2
-        cutoff = 600 + 1400 * lfo[min(mid, n - 1)]
-        filtered[i:end] = lowpass_filter(np.concatenate([pad[max(0, i - 1000):i], chunk]),
-                                          cutoff)[-(end - i):]
+    filtered = swept_lowpass_filter(pad, 600 + 1400 * lfo)
 
     save_wav("synth_outro.wav", filtered)
     return filtered
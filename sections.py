@@ -0,0 +1,22 @@
+"""Song sections shared by the submit scripts."""
+from typing import NamedTuple
+
+# Server IDs of the song's sections, the same for every instrument
+SECTION_IDS = {
+    "intro": "cmlg5vs6j0008ql01ukedpj5f",
+    "verse": "cmlg5vs6j0009ql01we6kfa07",
+    "chorus": "cmlg5vs6j000aql01cvfpbjyj",
+    "outro": "cmlg5vs6j000bql01mnvvbd4s",
+}
+
+
+class Section(NamedTuple):
+    name: str
+    section_id: str
+    filename: str
+    description: str
+
+    @classmethod
+    def of(cls, instrument, name, description):
+        """The named section, with the instrument's WAV for it."""
+        return cls(name, SECTION_IDS[name], f"{instrument}_{name}.wav", description)
@@ -1,118 +1,119 @@
-import base64
-import json
 import sys
 import os
 import urllib.request
 import urllib.error
 from dotenv import load_dotenv
+from sections import Section
+from upload import b64_size, batch_mutation, batch_variables, gzip_chunks, json_body_chunks, json_body_size, json_loads, pending_sections, record_submitted, send_upload
 
 load_dotenv()
 
 API_URL = "https://api.apocalypseradio.xyz/graphql"
 AUTH_TOKEN = os.environ["AUTH_TOKEN"]
 
-SECTIONS = [
-    {
-        "id": "cmlg5vs6j0008ql01ukedpj5f",
-        "file": "bass_intro.wav",
-        "name": "intro",
-        "description": "Subtle sub bass drone on C2 with slow fade-in, setting the dark atmosphere"
-    },
-    {
-        "id": "cmlg5vs6j0009ql01we6kfa07",
-        "file": "bass_verse.wav",
-        "name": "verse",
-        "description": "Driving synthwave saw bass pattern C2-C2-Eb2-F2 with low-pass filter, one beat per note"
-    },
-    {
-        "id": "cmlg5vs6j000aql01cvfpbjyj",
-        "file": "bass_chorus.wav",
-        "name": "chorus",
-        "description": "Full saw bass arpeggio C2-G2-Ab2-F2-Eb2-F2-G2-C3 with filter sweep from 400-900Hz"
-    },
-    {
-        "id": "cmlg5vs6j000bql01mnvvbd4s",
-        "file": "bass_outro.wav",
-        "name": "outro",
-        "description": "Sustained C2 saw bass with sub-sine layer, fading out over 8 seconds"
-    },
-]
-
-
-def submit_track(section):
-    print(f"\nSubmitting {section['name']}...")
-
-    # Read and base64 encode the WAV file
-    with open(section["file"], "rb") as f:
-        audio_data = f.read()
-    audio_b64 = base64.b64encode(audio_data).decode("utf-8")
-
-    print(f"  File size: {len(audio_data)} bytes, Base64 length: {len(audio_b64)}")
-
-    # Build GraphQL mutation
-    desc = section["description"]
-    query = """mutation {
-  submitTrack(
-    sectionId: "%s",
-    instrument: "bass",
-    audioBase64: "%s",
-    audioFilename: "bass_%s.wav",
-    description: "%s"
-  ) {
-    id
-    status
-  }
-}""" % (section['id'], audio_b64, section['name'], desc)
-
-    payload = json.dumps({"query": query}).encode("utf-8")
-
-    req = urllib.request.Request(
+MANIFEST_PATH = ".submitted_bass.json"
+
+# Built once; every request sends the same headers
+HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {AUTH_TOKEN}",
+}
+
+
+SECTIONS = (
+    Section.of("bass", "intro", "Subtle sub bass drone on C2 with slow fade-in, setting the dark atmosphere"),
+    Section.of("bass", "verse", "Driving synthwave saw bass pattern C2-C2-Eb2-F2 with low-pass filter, one beat per note"),
+    Section.of("bass", "chorus", "Full saw bass arpeggio C2-G2-Ab2-F2-Eb2-F2-G2-C3 with filter sweep from 400-900Hz"),
+    Section.of("bass", "outro", "Sustained C2 saw bass with sub-sine layer, fading out over 8 seconds"),
+)
+
+
+def report_tracks(resp, sections):
+    """Print the outcome of each aliased submitTrack."""
+    data = resp.get("data") or {}
+    for i, section in enumerate(sections):
+        name = section.name
+        track = data.get(f"t{i}")
+        if track:
+            print(f"  [{name}] SUCCESS: Track ID={track['id']}, Status={track['status']}")
+        else:
+            # Errors for one alias carry its name as the first path element
+            errors = [e for e in resp.get("errors", []) if (e.get("path") or [None])[0] == f"t{i}"]
+            print(f"  [{name}] ERROR: {errors or resp.get('errors')}")
+
+
+def upload_request(query, variables, audio_paths, compress):
+    # The body is a generator. Gzipped, its size isn't known up front, so
+    # urllib sends it with chunked transfer encoding; uncompressed, the exact
+    # length is known from the file sizes and the body goes out as is
+    body = json_body_chunks(query, variables, audio_paths)
+    if compress:
+        body = gzip_chunks(body)
+        headers = {**HEADERS, "Content-Encoding": "gzip"}
+    else:
+        size = json_body_size(query, variables, audio_paths)
+        headers = {**HEADERS, "Content-Length": str(size)}
+    return urllib.request.Request(
         API_URL,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {AUTH_TOKEN}",
-        },
+        data=body,
+        headers=headers,
         method="POST"
     )
 
-    try:
-        with urllib.request.urlopen(req, timeout=120) as response:
-            resp_text = response.read().decode("utf-8")
-            print(f"  Response: {resp_text[:500]}")
 
-            resp = json.loads(resp_text)
-            if "errors" in resp:
-                print(f"  ERROR: {resp['errors']}")
-                return False
-            if "data" in resp and resp["data"].get("submitTrack"):
-                track = resp["data"]["submitTrack"]
-                print(f"  SUCCESS: Track ID={track['id']}, Status={track['status']}")
-                return True
+def post_upload(query, variables, audio_paths, compress):
+    """POST the upload and return its status and body, error statuses included."""
+    try:
+        with urllib.request.urlopen(upload_request(query, variables, audio_paths, compress), timeout=120) as response:
+            return response.status, response.read().decode("utf-8")
     except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8")
-        print(f"  HTTP Error {e.code}: {body[:500]}")
-        return False
+        with e:
+            return e.code, e.read().decode("utf-8")
+
+
+def submit_tracks(force=False):
+    """Upload the sections that changed since the last submit, or all of them if force.
+
+    Returns how many were uploaded and how many were skipped as unchanged.
+    """
+    pending, digests, manifest = pending_sections(SECTIONS, MANIFEST_PATH, force)
+    skipped = len(SECTIONS) - len(pending)
+    if not pending:
+        return 0, skipped
+
+    variables = batch_variables("bass", pending)
+    audio_paths = {}
+    for i, section in enumerate(pending):
+        audio_paths[f"audioBase64_{i}"] = section.filename
+        print(f"  [{section.name}] File size: {os.path.getsize(section.filename)} bytes, Base64 length: {b64_size(section.filename)}")
+
+    # The pending sections go up in one request, saving a round trip per track
+    print(f"Submitting {len(pending)} tracks...")
+    submitted = []
+    query = batch_mutation(len(pending))
+    try:
+        status, resp_text = send_upload(lambda compress: post_upload(query, variables, audio_paths, compress))
+        if status == 200:
+            print(f"  Response: {resp_text[:500]}")
+            resp = json_loads(resp_text)
+            report_tracks(resp, pending)
+            submitted = record_submitted(MANIFEST_PATH, manifest, digests, pending, resp.get("data") or {})
+        else:
+            print(f"  HTTP Error {status}: {resp_text[:500]}")
     except urllib.error.URLError as e:
         print(f"  URL Error: {e.reason}")
-        return False
     except Exception as e:
         print(f"  Error: {e}")
-        return False
-
-    return False
+    return len(submitted), skipped
 
 
 if __name__ == "__main__":
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-    success_count = 0
-    for section in SECTIONS:
-        if submit_track(section):
-            success_count += 1
+    uploaded, skipped = submit_tracks(force="--force" in sys.argv[1:])
 
     print(f"\n{'='*50}")
-    print(f"Submitted {success_count}/{len(SECTIONS)} bass tracks successfully")
+    print(f"Uploaded {uploaded}/{len(SECTIONS) - skipped} bass tracks, skipped {skipped} unchanged")
 
-    if success_count < len(SECTIONS):
+    if uploaded + skipped < len(SECTIONS):
         sys.exit(1)
@@ -1,74 +1,146 @@
 import requests
-import base64
 import os
+import sys
+from contextlib import ExitStack
 from dotenv import load_dotenv
+from sections import Section
+from upload import batch_mutation, batch_variables, gzip_chunks, json_body_chunks, json_body_size, json_dumps, json_loads, pending_sections, record_submitted, send_upload
 
 load_dotenv()
 
 API_URL = "https://api.apocalypseradio.xyz/graphql"
 AUTH_TOKEN = os.environ["AUTH_TOKEN"]
 
+# Send the WAVs as GraphQL multipart uploads only when asked to, since the
+# server's submitTrack has no Upload argument yet
+MULTIPART_UPLOADS = os.environ.get("SUBMIT_MULTIPART") == "1"
+
 HEADERS = {
     "Content-Type": "application/json",
     "Authorization": f"Bearer {AUTH_TOKEN}"
 }
 
+# One session for every request, so the TLS connection is kept alive
+# between a gzipped upload and an uncompressed retry
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-sections = [
-    {
-        "section_id": "cmlg5vs6j0008ql01ukedpj5f",
-        "filename": "drums_intro.wav",
-        "description": "Light hi-hats building atmosphere, starting soft and gradually increasing in volume with occasional open hats in the second half"
-    },
-    {
-        "section_id": "cmlg5vs6j0009ql01we6kfa07",
-        "filename": "drums_verse.wav",
-        "description": "Classic electronic beat with kick on 1 and 3, snare on 2 and 4, closed hi-hats on eighth notes"
-    },
-    {
-        "section_id": "cmlg5vs6j000aql01cvfpbjyj",
-        "filename": "drums_chorus.wav",
-        "description": "Energetic four-on-the-floor kick pattern with snare on 2 and 4, open hi-hats on off-beats, snare fills every 4th bar"
-    },
-    {
-        "section_id": "cmlg5vs6j000bql01mnvvbd4s",
-        "filename": "drums_outro.wav",
-        "description": "Gradually fading drum pattern, elements dropping out progressively as the track winds down"
-    },
-]
-
-for section in sections:
-    filepath = os.path.join(BASE_DIR, section["filename"])
-    with open(filepath, "rb") as f:
-        audio_b64 = base64.b64encode(f.read()).decode("utf-8")
-
-    mutation = """
-    mutation($sectionId: String!, $instrument: String!, $audioBase64: String!, $audioFilename: String!, $description: String!) {
-        submitTrack(sectionId: $sectionId, instrument: $instrument, audioBase64: $audioBase64, audioFilename: $audioFilename, description: $description) {
-            id
-            status
-        }
-    }
+MANIFEST_PATH = os.path.join(BASE_DIR, ".submitted_drums.json")
+
+
+class SizedBody:
+    """A streamed body of known length.
+
+    requests sends a plain generator with chunked transfer encoding; given
+    a length it sets Content-Length and streams the chunks as they are.
     """
 
-    variables = {
-        "sectionId": section["section_id"],
-        "instrument": "drums",
-        "audioBase64": audio_b64,
-        "audioFilename": section["filename"],
-        "description": section["description"]
-    }
+    def __init__(self, chunks, size):
+        self.chunks = chunks
+        self.size = size
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __len__(self):
+        return self.size
+
+
+SECTIONS = (
+    Section.of("drums", "intro", "Light hi-hats building atmosphere, starting soft and gradually increasing in volume with occasional open hats in the second half"),
+    Section.of("drums", "verse", "Classic electronic beat with kick on 1 and 3, snare on 2 and 4, closed hi-hats on eighth notes"),
+    Section.of("drums", "chorus", "Energetic four-on-the-floor kick pattern with snare on 2 and 4, open hi-hats on off-beats, snare fills every 4th bar"),
+    Section.of("drums", "outro", "Gradually fading drum pattern, elements dropping out progressively as the track winds down"),
+)
+
+
+def section_path(section):
+    return os.path.join(BASE_DIR, section.filename)
+
 
-    payload = {
-        "query": mutation,
+def submit_multipart(batch):
+    """Send the WAVs as file parts following the GraphQL multipart request spec.
+
+    Returns the response's status and body.
+    """
+    variables = batch_variables("drums", batch)
+    variables.update({f"audio_{i}": None for i in range(len(batch))})
+    operations = {
+        "query": batch_mutation(len(batch), "audio", "Upload!"),
         "variables": variables
     }
+    file_map = {str(i): [f"variables.audio_{i}"] for i in range(len(batch))}
+    with ExitStack() as stack:
+        files = {
+            str(i): (section.filename, stack.enter_context(open(section_path(section), "rb")), "audio/wav")
+            for i, section in enumerate(batch)
+        }
+        resp = SESSION.post(
+            API_URL,
+            data={
+                "operations": json_dumps(operations),
+                "map": json_dumps(file_map),
+            },
+            files=files,
+            # Drop the session's JSON content type so requests sets the
+            # multipart boundary; the preflight header satisfies Apollo's
+            # CSRF check for multipart requests
+            headers={"Content-Type": None, "Apollo-Require-Preflight": "true"},
+            timeout=60,
+        )
+    return resp.status_code, resp.text
+
+
+def submit_base64(batch):
+    """Send the WAVs base64-encoded in a streamed JSON body.
+
+    Returns the response's status and body.
+    """
+    query = batch_mutation(len(batch))
+    variables = batch_variables("drums", batch)
+    audio_paths = {f"audioBase64_{i}": section_path(section) for i, section in enumerate(batch)}
+
+    def post(compress):
+        if compress:
+            payload = gzip_chunks(json_body_chunks(query, variables, audio_paths))
+            resp = SESSION.post(API_URL, data=payload, headers={"Content-Encoding": "gzip"}, timeout=60)
+        else:
+            payload = SizedBody(
+                json_body_chunks(query, variables, audio_paths),
+                json_body_size(query, variables, audio_paths),
+            )
+            resp = SESSION.post(API_URL, data=payload, timeout=60)
+        return resp.status_code, resp.text
 
-    print(f"Submitting {section['filename']}...")
-    resp = requests.post(API_URL, json=payload, headers=HEADERS, timeout=60)
-    print(f"  Status: {resp.status_code}")
-    print(f"  Response: {resp.text[:500]}")
+    return send_upload(post)
+
+
+def response_data(body):
+    """The GraphQL data object of a response body, or {} if it has none."""
+    try:
+        return json_loads(body).get("data") or {}
+    except (ValueError, AttributeError):
+        return {}
+
+
+pending, digests, manifest = pending_sections(SECTIONS, MANIFEST_PATH, force="--force" in sys.argv[1:], base_dir=BASE_DIR)
+
+uploaded = 0
+if pending:
+    # All pending sections go up in a single request. As multipart uploads
+    # the WAVs travel as raw bytes instead of 33% larger base64 in JSON
+    print(f"Submitting {len(pending)} drum tracks...")
+    if MULTIPART_UPLOADS:
+        status, body = submit_multipart(pending)
+    else:
+        status, body = submit_base64(pending)
+
+    print(f"  Status: {status}")
+    print(f"  Response: {body[:500]}")
     print()
 
-print("All drum tracks submitted!")
+    uploaded = len(record_submitted(MANIFEST_PATH, manifest, digests, pending, response_data(body)))
+
+print(f"Uploaded {uploaded}/{len(pending)} drum tracks, skipped {len(SECTIONS) - len(pending)} unchanged")
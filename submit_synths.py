@@ -1,9 +1,10 @@
-import base64
-import json
+import http.client
 import os
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
+import sys
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
+from sections import Section
+from upload import b64_size, batch_mutation, batch_variables, gzip_chunks, json_body_chunks, json_body_size, json_loads, pending_sections, record_submitted, send_upload
 
 load_dotenv()
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -11,69 +12,79 @@ os.chdir(os.path.dirname(os.path.abspath(__file__)))
 API_URL = "https://api.apocalypseradio.xyz/graphql"
 TOKEN = os.environ["AUTH_TOKEN"]
 
-sections = [
-    {
-        "section_id": "cmlg5vs6j0008ql01ukedpj5f",
-        "wav_file": "synth_intro.wav",
-        "filename": "synth_intro.wav",
-        "description": "Atmospheric Cm pad with detuned saw oscillators, slow 2-second attack, LFO-modulated filter sweep for movement"
-    },
-    {
-        "section_id": "cmlg5vs6j0009ql01we6kfa07",
-        "wav_file": "synth_verse.wav",
-        "filename": "synth_verse.wav",
-        "description": "Plucky arpeggiated synth: C4-Eb4-G4-C5 pattern at 8th note speed, bright saw tone with fast attack/decay"
-    },
-    {
-        "section_id": "cmlg5vs6j000aql01cvfpbjyj",
-        "wav_file": "synth_chorus.wav",
-        "filename": "synth_chorus.wav",
-        "description": "Full chord stabs (Cm-Ab-Eb-Bb progression) with square wave lead melody (Bb4-C5-Eb5-G4 motif) and vibrato"
-    },
-    {
-        "section_id": "cmlg5vs6j000bql01mnvvbd4s",
-        "wav_file": "synth_outro.wav",
-        "filename": "synth_outro.wav",
-        "description": "Atmospheric Cm pad fading to silence, detuned saw oscillators with LFO filter modulation"
-    }
-]
+# One connection for every request, kept alive between a gzipped upload
+# and an uncompressed retry instead of doing a new TLS handshake each time
+API = urlsplit(API_URL)
+CONN = http.client.HTTPSConnection(API.hostname, API.port, timeout=60)
 
-for section in sections:
-    print(f"\nSubmitting {section['wav_file']} to section {section['section_id']}...")
+MANIFEST_PATH = ".submitted_synths.json"
 
-    # Read and base64 encode
-    with open(section["wav_file"], "rb") as f:
-        audio_b64 = base64.b64encode(f.read()).decode("utf-8")
+# Built once; every request sends the same headers
+HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {TOKEN}",
+}
 
-    print(f"  Base64 length: {len(audio_b64)}")
+SECTIONS = (
+    Section.of("synth", "intro", "Atmospheric Cm pad with detuned saw oscillators, slow 2-second attack, LFO-modulated filter sweep for movement"),
+    Section.of("synth", "verse", "Plucky arpeggiated synth: C4-Eb4-G4-C5 pattern at 8th note speed, bright saw tone with fast attack/decay"),
+    Section.of("synth", "chorus", "Full chord stabs (Cm-Ab-Eb-Bb progression) with square wave lead melody (Bb4-C5-Eb5-G4 motif) and vibrato"),
+    Section.of("synth", "outro", "Atmospheric Cm pad fading to silence, detuned saw oscillators with LFO filter modulation"),
+)
 
-    # Build GraphQL mutation
-    description_escaped = section["description"].replace('"', '\\"')
-    query = f'''mutation {{
-  submitTrack(
-    sectionId: "{section['section_id']}",
-    instrument: "synth",
-    audioBase64: "{audio_b64}",
-    audioFilename: "{section['filename']}",
-    description: "{description_escaped}"
-  ) {{
-    id
-    status
-  }}
-}}'''
 
-    payload = json.dumps({"query": query}).encode("utf-8")
+def post_upload(query, variables, audio_paths, compress):
+    """POST the upload on the shared connection and return its status and body."""
+    # The body is a generator. Gzipped, its size isn't known up front, so it
+    # goes out with chunked transfer encoding; uncompressed, the exact length
+    # is known from the file sizes and the body goes out as is
+    body = json_body_chunks(query, variables, audio_paths)
+    if compress:
+        body = gzip_chunks(body)
+        headers = {**HEADERS, "Content-Encoding": "gzip"}
+    else:
+        size = json_body_size(query, variables, audio_paths)
+        headers = {**HEADERS, "Content-Length": str(size)}
+    try:
+        CONN.request("POST", API.path, body=body, headers=headers, encode_chunked=compress)
+        resp = CONN.getresponse()
+        return resp.status, resp.read().decode("utf-8")
+    except Exception:
+        # Leave a fresh connection for a retry
+        CONN.close()
+        raise
+
 
-    req = Request(API_URL, data=payload, method="POST")
-    req.add_header("Content-Type", "application/json")
-    req.add_header("Authorization", f"Bearer {TOKEN}")
+print()
+pending, digests, manifest = pending_sections(SECTIONS, MANIFEST_PATH, force="--force" in sys.argv[1:])
 
+variables = batch_variables("synth", pending)
+audio_paths = {}
+for i, section in enumerate(pending):
+    audio_paths[f"audioBase64_{i}"] = section.filename
+    print(f"  [{section.filename}] Base64 length: {b64_size(section.filename)}")
+
+uploaded = 0
+if pending:
+    # The pending sections go up in one request, saving a round trip per track
+    print(f"Submitting {len(pending)} synth tracks...")
     try:
-        with urlopen(req, timeout=60) as resp:
-            body = resp.read().decode("utf-8")
+        query = batch_mutation(len(pending))
+        status, body = send_upload(lambda compress: post_upload(query, variables, audio_paths, compress))
+    except (OSError, http.client.HTTPException) as e:
+        print(f"  Connection Error: {e}")
+    else:
+        try:
+            # A proxy error page can come back as a 200 too
+            data = (json_loads(body).get("data") or {}) if status == 200 else None
+        except (ValueError, AttributeError):
+            data = None
+        if data is not None:
             print(f"  Response: {body[:500]}")
-    except HTTPError as e:
-        body = e.read().decode("utf-8")
-        print(f"  HTTP Error {e.code}: {body[:500]}")
-    except URLError as e:
-        print(f"  URL Error: {e.reason}")
+            uploaded = len(record_submitted(MANIFEST_PATH, manifest, digests, pending, data))
+        else:
+            print(f"  HTTP Error {status}: {body[:500]}")
+    finally:
+        CONN.close()
+
+print(f"\nUploaded {uploaded}/{len(pending)} synth tracks, skipped {len(SECTIONS) - len(pending)} unchanged")
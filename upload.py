@@ -0,0 +1,270 @@
+"""Streamed upload bodies and submit manifests shared by the submit scripts."""
+try:
+    # SIMD-accelerated drop-in for the stdlib codec, if it is installed
+    import pybase64 as base64
+except ImportError:
+    import base64
+import hashlib
+import json
+import os
+import queue
+import threading
+import zlib
+
+try:
+    # Faster JSON codec that encodes straight to bytes, if it is installed
+    import orjson
+    json_dumps, json_loads = orjson.dumps, orjson.loads
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+    json_loads = json.loads
+
+# A multiple of 3 bytes, so only the final chunk can carry '=' padding and
+# the encoded chunks join into one valid base64 string
+B64_CHUNK_SIZE = 57 * 1024
+
+# Chunks each pipeline stage may run ahead of the next
+PIPELINE_DEPTH = 4
+
+_DONE = object()
+
+
+def batch_mutation(count, audio_arg="audioBase64", audio_type="String!"):
+    """Build one mutation submitting count tracks as aliased fields t0, t1, ...
+
+    Every track gets its own numbered variables and the instrument is
+    shared. The audio travels as the audio_arg variable, so the payload is
+    JSON-encoded once instead of being spliced into the query and escaped.
+    """
+    params = ["$instrument: String!"]
+    fields = []
+    for i in range(count):
+        params.append(f"$sectionId_{i}: String!, ${audio_arg}_{i}: {audio_type}, $audioFilename_{i}: String!, $description_{i}: String!")
+        fields.append(
+            f"  t{i}: submitTrack(sectionId: $sectionId_{i}, instrument: $instrument, {audio_arg}: ${audio_arg}_{i}, "
+            f"audioFilename: $audioFilename_{i}, description: $description_{i}) {{\n    id\n    status\n  }}"
+        )
+    return "mutation(" + ", ".join(params) + ") {\n" + "\n".join(fields) + "\n}"
+
+
+def batch_variables(instrument, sections):
+    """Every variable of batch_mutation but the audio, which each transport adds its own way."""
+    variables = {"instrument": instrument}
+    for i, section in enumerate(sections):
+        variables[f"sectionId_{i}"] = section.section_id
+        variables[f"audioFilename_{i}"] = section.filename
+        variables[f"description_{i}"] = section.description
+    return variables
+
+
+def file_digest(path):
+    """BLAKE2b hash of a file, read in 1 MiB blocks."""
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(path):
+    """Content hashes of the files last submitted successfully, per section."""
+    try:
+        with open(path, "rb") as f:
+            return json_loads(f.read())
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(path, manifest):
+    with open(path, "wb") as f:
+        f.write(json_dumps(manifest))
+
+
+def pending_sections(sections, manifest_path, force=False, base_dir=""):
+    """Pick the sections whose WAV changed since it was last submitted.
+
+    The manifest at manifest_path keeps the content hash of each section's
+    file as of its last successful submit, so a re-run only uploads what
+    changed; force uploads everything. Returns the pending sections, the
+    current hashes and the manifest, for record_submitted.
+    """
+    manifest = load_manifest(manifest_path)
+    digests = {section.section_id: file_digest(os.path.join(base_dir, section.filename)) for section in sections}
+    pending = []
+    for section in sections:
+        if not force and manifest.get(section.section_id) == digests[section.section_id]:
+            print(f"  [{section.filename}] Unchanged since the last submit, skipping")
+        else:
+            pending.append(section)
+    return pending, digests, manifest
+
+
+def record_submitted(manifest_path, manifest, digests, pending, data):
+    """Save the hashes of the pending sections whose alias in data succeeded, and return those sections."""
+    submitted = [section for i, section in enumerate(pending) if data.get(f"t{i}")]
+    for section in submitted:
+        manifest[section.section_id] = digests[section.section_id]
+    save_manifest(manifest_path, manifest)
+    return submitted
+
+
+def b64_size(path):
+    """Exact length of a file's base64 encoding, padding included."""
+    return (os.path.getsize(path) + 2) // 3 * 4
+
+
+def _put(q, item, stop):
+    # Give up once the consumer has gone away, instead of blocking forever
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(q, stop):
+    """Yield items from q until its stage finishes, re-raising the stage's error."""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _run_stage(produce, out, stop):
+    """Feed everything produce() yields into out, then an end marker or the error."""
+    try:
+        for item in produce():
+            if not _put(out, item, stop):
+                return
+        item = _DONE
+    except BaseException as e:
+        item = e
+    _put(out, item, stop)
+
+
+def b64_chunks(path):
+    """Yield a file's base64 encoding chunk by chunk, from a three-stage pipeline.
+
+    A reader thread pulls raw chunks off disk and an encoder thread encodes
+    them while the caller sends earlier ones, so disk, CPU and network work
+    overlap. The queues between stages are bounded, so only a few chunks
+    are ever in memory.
+    """
+    stop = threading.Event()
+    raw = queue.Queue(PIPELINE_DEPTH)
+    encoded = queue.Queue(PIPELINE_DEPTH)
+
+    def read():
+        with open(path, "rb", buffering=0) as f:
+            while chunk := f.read(B64_CHUNK_SIZE):
+                yield chunk
+
+    def encode():
+        for chunk in _drain(raw, stop):
+            yield base64.b64encode(chunk)
+
+    for produce, out in ((read, raw), (encode, encoded)):
+        threading.Thread(target=_run_stage, args=(produce, out, stop), daemon=True).start()
+    try:
+        yield from _drain(encoded, stop)
+    finally:
+        stop.set()
+
+
+def json_body_chunks(query, variables, audio_paths):
+    """Yield a GraphQL JSON request body piece by piece, to be sent chunked.
+
+    variables is JSON-encoded as usual. audio_paths maps further
+    variable names to WAV files, whose base64 is streamed into the body as
+    it is encoded, so only one chunk of audio is in memory at a time.
+    Base64 only uses [A-Za-z0-9+/=], which JSON never escapes, so the
+    chunks go out without being scanned or copied.
+    """
+    yield json_dumps({"query": query, "variables": variables})[:-2]
+    for name, path in audio_paths.items():
+        yield f', "{name}": "'.encode("ascii")
+        yield from b64_chunks(path)
+        yield b'"'
+    yield b"}}"
+
+
+def json_body_size(query, variables, audio_paths):
+    """Exact length in bytes of the body json_body_chunks yields."""
+    size = len(json_dumps({"query": query, "variables": variables})) - 2
+    for name, path in audio_paths.items():
+        size += len(f', "{name}": "') + b64_size(path) + 1
+    return size + 2
+
+
+def gzip_refused(status, body):
+    """Whether the response to a gzipped upload means the server can't read gzip.
+
+    415 says so outright, but most servers without gzip support answer 400.
+    Apollo also answers 400 to an invalid query, with a GraphQL error object
+    as the body; that one would fail again uncompressed, so it counts as an
+    answer rather than a refusal.
+    """
+    if status == 415:
+        return True
+    if status != 400:
+        return False
+    try:
+        return not isinstance(json_loads(body).get("errors"), list)
+    except (ValueError, AttributeError):
+        return True
+
+
+def connection_dropped(exc):
+    """Whether exc is, or wraps, the server closing the connection mid-upload.
+
+    Failures to connect at all, DNS errors and timeouts don't count: those
+    would fail the same way uncompressed.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, (BrokenPipeError, ConnectionResetError, ConnectionAbortedError)):
+            return True
+        seen.add(id(exc))
+        exc = getattr(exc, "reason", None) or exc.__cause__ or exc.__context__
+    return False
+
+
+def send_upload(post):
+    """Send an upload through post(compress), which returns (status, body).
+
+    Uploads go uncompressed unless SUBMIT_GZIP=1 is set, since the server
+    may not accept gzip. When it is set, the gzipped body goes first and is
+    sent again uncompressed if the server refuses it or drops the connection.
+    """
+    if os.environ.get("SUBMIT_GZIP") == "1":
+        try:
+            status, body = post(True)
+            if not gzip_refused(status, body):
+                return status, body
+        except Exception as e:
+            if not connection_dropped(e):
+                raise
+    return post(False)
+
+
+def gzip_chunks(chunks, level=1):
+    """Gzip a stream of body chunks on the fly.
+
+    Base64 spends 8 bits on every 6 bits of audio, so even the cheapest
+    level wins most of that back.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()